@@ -9,99 +9,294 @@ Usage:
 Output: JSON to stdout with result metadata
 """
 
+from __future__ import annotations
+
 import sys
 import os
 import json
 import argparse
 import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import fitz  # PyMuPDF
-import numpy as np
-from PIL import Image, ImageDraw, ImageFilter
+# Heavy imports (PyMuPDF, NumPy, Pillow, Numba) are deferred to
+# _import_heavy() so argument parsing and --help never pay their
+# startup cost; the script is spawned per diff by the server.
+fitz = None
+np = None
+Image = None
+ImageDraw = None
+HAVE_NUMBA = False
+
+_diff_kernel = None
+_diff_compose_kernel = None
+_compose_kernel = None
+
+
+def _import_heavy() -> None:
+    global fitz, np, Image, ImageDraw, HAVE_NUMBA
+    global _diff_kernel, _diff_compose_kernel, _compose_kernel
+
+    if np is not None:
+        return
+
+    import fitz as _fitz  # PyMuPDF
+    import numpy as _np
+    from PIL import Image as _Image, ImageDraw as _ImageDraw
+
+    fitz = _fitz
+    np = _np
+    Image = _Image
+    ImageDraw = _ImageDraw
+
+    # Keep compiled kernels in a stable writable location so the JIT
+    # cost is paid once, not once per invocation.
+    os.environ.setdefault(
+        "NUMBA_CACHE_DIR",
+        os.path.join(tempfile.gettempdir(), "visual-diff-numba-cache"),
+    )
 
+    try:
+        from numba import njit, prange, types
+        HAVE_NUMBA = True
+    except ImportError:
+        return
+
+    # Explicit signatures compile (or load from cache) here instead of
+    # lazily on the first page, and pin the uint8 C-contiguous layouts
+    # the pipeline guarantees. Inputs may be readonly views from PIL.
+    u8_page_ro = types.Array(types.uint8, 3, "C", readonly=True)
+    u8_page = types.uint8[:, :, ::1]
+    mask_2d = types.boolean[:, ::1]
+
+    @njit(types.int64(u8_page_ro, u8_page_ro, types.int64, mask_2d),
+          parallel=True, cache=True, fastmath=True)
+    def diff_kernel(arr1, arr2, sensitivity, mask):
+        h, w, _ = arr1.shape
+        count = 0
+        for y in prange(h):
+            row_count = 0
+            for x in range(w):
+                max_d = 0
+                for c in range(3):
+                    d = abs(np.int32(arr1[y, x, c]) - np.int32(arr2[y, x, c]))
+                    if d > max_d:
+                        max_d = d
+                changed = max_d > sensitivity
+                mask[y, x] = changed
+                if changed:
+                    row_count += 1
+            count += row_count
+        return count
 
-def pdf_page_to_image(pdf_path: str, page_num: int = 0, dpi: int = 150) -> Image.Image:
-    doc = fitz.open(pdf_path)
+    @njit(types.void(u8_page_ro, u8_page_ro, types.int64, mask_2d, u8_page,
+                     types.int64[::1]),
+          parallel=True, cache=True)
+    def diff_compose_kernel(arr1, arr2, sensitivity, mask, out, row_counts):
+        # Fused diff + composite: each row block is read once and stays
+        # hot in cache for both the threshold and the blend.
+        h, w, _ = arr1.shape
+        for y in prange(h):
+            row_count = 0
+            for x in range(w):
+                max_d = 0
+                for c in range(3):
+                    d = abs(np.int32(arr1[y, x, c]) - np.int32(arr2[y, x, c]))
+                    if d > max_d:
+                        max_d = d
+                if max_d > sensitivity:
+                    mask[y, x] = True
+                    row_count += 1
+                    brightness = (np.int32(arr2[y, x, 0]) +
+                                  np.int32(arr2[y, x, 1]) +
+                                  np.int32(arr2[y, x, 2])) // 3
+                    if brightness < 128:
+                        o_r, o_g, o_b, o_a = 255, 50, 50, 180
+                    else:
+                        o_r, o_g, o_b, o_a = 50, 50, 255, 140
+                    inv_a = 255 - o_a
+                    out[y, x, 0] = (o_r * o_a + np.int32(arr1[y, x, 0]) * inv_a + 127) // 255
+                    out[y, x, 1] = (o_g * o_a + np.int32(arr1[y, x, 1]) * inv_a + 127) // 255
+                    out[y, x, 2] = (o_b * o_a + np.int32(arr1[y, x, 2]) * inv_a + 127) // 255
+                else:
+                    mask[y, x] = False
+                    out[y, x, 0] = arr1[y, x, 0]
+                    out[y, x, 1] = arr1[y, x, 1]
+                    out[y, x, 2] = arr1[y, x, 2]
+            row_counts[y] = row_count
+
+    @njit(types.void(u8_page_ro, u8_page_ro, mask_2d, u8_page),
+          parallel=True, cache=True)
+    def compose_kernel(arr1, arr2, mask, out):
+        h, w, _ = arr1.shape
+        for y in prange(h):
+            for x in range(w):
+                if mask[y, x]:
+                    brightness = (np.int32(arr2[y, x, 0]) +
+                                  np.int32(arr2[y, x, 1]) +
+                                  np.int32(arr2[y, x, 2])) // 3
+                    if brightness < 128:
+                        o_r, o_g, o_b, o_a = 255, 50, 50, 180
+                    else:
+                        o_r, o_g, o_b, o_a = 50, 50, 255, 140
+                    inv_a = 255 - o_a
+                    out[y, x, 0] = (o_r * o_a + np.int32(arr1[y, x, 0]) * inv_a + 127) // 255
+                    out[y, x, 1] = (o_g * o_a + np.int32(arr1[y, x, 1]) * inv_a + 127) // 255
+                    out[y, x, 2] = (o_b * o_a + np.int32(arr1[y, x, 2]) * inv_a + 127) // 255
+                else:
+                    out[y, x, 0] = arr1[y, x, 0]
+                    out[y, x, 1] = arr1[y, x, 1]
+                    out[y, x, 2] = arr1[y, x, 2]
+
+    _diff_kernel = diff_kernel
+    _diff_compose_kernel = diff_compose_kernel
+    _compose_kernel = compose_kernel
+
+
+def pdf_page_to_array(pdf_path: str, page_num: int = 0, dpi: int = 150,
+                      doc=None) -> np.ndarray:
+    owns_doc = doc is None
+    if owns_doc:
+        doc = fitz.open(pdf_path)
     if page_num >= len(doc):
         raise ValueError(f"Page {page_num} does not exist in {pdf_path} (has {len(doc)} pages)")
     page = doc[page_num]
     zoom = dpi / 72.0
     mat = fitz.Matrix(zoom, zoom)
     pix = page.get_pixmap(matrix=mat, alpha=False)
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    doc.close()
-    return img
+    arr = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3).copy()
+    if owns_doc:
+        doc.close()
+    return arr
 
 
-def load_image(file_path: str, page_num: int = 0, dpi: int = 150) -> Image.Image:
+def load_image(file_path: str, page_num: int = 0, dpi: int = 150,
+               doc=None) -> np.ndarray:
     ext = Path(file_path).suffix.lower()
     if ext == ".pdf":
-        return pdf_page_to_image(file_path, page_num, dpi)
+        return pdf_page_to_array(file_path, page_num, dpi, doc)
     elif ext in (".png", ".jpg", ".jpeg", ".tiff", ".tif", ".bmp"):
-        return Image.open(file_path).convert("RGB")
+        return np.asarray(Image.open(file_path).convert("RGB"))
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
 
-def get_page_count(file_path: str) -> int:
+def _open_document(file_path: str) -> tuple:
+    # Returns (fitz.Document or None, page count); PDFs are opened once
+    # and the handle reused for every page render in this process.
     ext = Path(file_path).suffix.lower()
     if ext == ".pdf":
         doc = fitz.open(file_path)
-        count = len(doc)
-        doc.close()
-        return count
-    return 1
-
-
-def normalize_sizes(img1: Image.Image, img2: Image.Image) -> tuple:
-    w = max(img1.width, img2.width)
-    h = max(img1.height, img2.height)
-
-    def pad_image(img, target_w, target_h):
-        if img.width == target_w and img.height == target_h:
-            return img
-        padded = Image.new("RGB", (target_w, target_h), (255, 255, 255))
-        padded.paste(img, (0, 0))
-        return padded
-
-    return pad_image(img1, w, h), pad_image(img2, w, h)
-
-
-def compute_diff(img1: Image.Image, img2: Image.Image, sensitivity: int = 30) -> dict:
-    arr1 = np.array(img1, dtype=np.int16)
-    arr2 = np.array(img2, dtype=np.int16)
+        return doc, len(doc)
+    return None, 1
+
+
+def normalize_sizes(arr1: np.ndarray, arr2: np.ndarray) -> tuple:
+    h = max(arr1.shape[0], arr2.shape[0])
+    w = max(arr1.shape[1], arr2.shape[1])
+
+    def pad_array(arr, target_h, target_w):
+        if arr.shape[0] == target_h and arr.shape[1] == target_w:
+            return arr
+        pad_h = target_h - arr.shape[0]
+        pad_w = target_w - arr.shape[1]
+        return np.pad(arr, ((0, pad_h), (0, pad_w), (0, 0)), constant_values=255)
+
+    return pad_array(arr1, h, w), pad_array(arr2, h, w)
+
+
+def _change_pct(changed_pixels: int, total_pixels: int) -> float:
+    # Integer math with half-up rounding: exact to 2 dp and stable
+    # across platforms, unlike float round().
+    return ((changed_pixels * 10000 + total_pixels // 2) // total_pixels) / 100.0
+
+
+def compute_diff(arr1: np.ndarray, arr2: np.ndarray, sensitivity: int = 30) -> dict:
+    arr1_u8 = np.ascontiguousarray(arr1)
+    arr2_u8 = np.ascontiguousarray(arr2)
+
+    if HAVE_NUMBA:
+        mask = np.empty(arr1_u8.shape[:2], dtype=np.bool_)
+        changed_pixels = int(_diff_kernel(arr1_u8, arr2_u8, sensitivity, mask))
+        total_pixels = mask.size
+        change_pct = _change_pct(changed_pixels, total_pixels)
+        return {
+            "mask_packed": np.packbits(mask, axis=1),
+            "arr1": arr1_u8,
+            "arr2": arr2_u8,
+            "total_pixels": total_pixels,
+            "changed_pixels": changed_pixels,
+            "change_percentage": change_pct,
+        }
 
-    diff = np.abs(arr1 - arr2)
-    diff_gray = np.max(diff, axis=2)
+    # Per-channel abs-diff with a running max keeps the temporaries at
+    # H x W uint8 instead of a full H x W x 3 int16 tensor.
+    diff_gray = None
+    for c in range(3):
+        a = arr1_u8[:, :, c]
+        b = arr2_u8[:, :, c]
+        d = np.where(a > b, a - b, b - a)
+        diff_gray = d if diff_gray is None else np.maximum(diff_gray, d, out=diff_gray)
     mask = diff_gray > sensitivity
 
     total_pixels = mask.size
     changed_pixels = int(np.sum(mask))
-    change_pct = round((changed_pixels / total_pixels) * 100, 2)
+    change_pct = _change_pct(changed_pixels, total_pixels)
 
     return {
-        "mask": mask,
-        "diff_gray": diff_gray,
+        "mask_packed": np.packbits(mask, axis=1),
+        "arr1": arr1_u8,
+        "arr2": arr2_u8,
         "total_pixels": total_pixels,
         "changed_pixels": changed_pixels,
         "change_percentage": change_pct,
     }
 
 
+def _unpack_mask(diff_result: dict) -> np.ndarray:
+    # The mask travels bit-packed (1 bit/pixel); unpack to bools only for
+    # consumers that need dense indexing.
+    h, w = diff_result["arr1"].shape[:2]
+    return np.unpackbits(diff_result["mask_packed"], axis=1, count=w).view(np.bool_)
+
+
 def generate_overlay(
-    img1: Image.Image,
-    img2: Image.Image,
+    arr1: np.ndarray,
+    arr2: np.ndarray,
     diff_result: dict,
     output_path: str,
 ) -> dict:
-    mask = diff_result["mask"]
-    h, w = mask.shape
+    h, w = diff_result["arr1"].shape[:2]
+
+    if diff_result["changed_pixels"] == 0:
+        # Identical pages: the composite would reproduce the base image.
+        Image.fromarray(diff_result["arr1"], "RGB").save(output_path, "PNG", compress_level=1)
+        return {
+            "width": w,
+            "height": h,
+            "output_path": output_path,
+        }
 
-    arr1 = np.array(img1.convert("RGBA"))
-    arr2 = np.array(img2)
+    mask = _unpack_mask(diff_result)
+
+    if HAVE_NUMBA:
+        arr1 = diff_result["arr1"]
+        arr2 = diff_result["arr2"]
+        result_arr = np.empty((h, w, 3), dtype=np.uint8)
+        _compose_kernel(arr1, arr2, mask, result_arr)
+        result_img = Image.fromarray(result_arr, "RGB")
+        result_img.save(output_path, "PNG", compress_level=1)
+        return {
+            "width": w,
+            "height": h,
+            "output_path": output_path,
+        }
 
-    brightness = np.mean(arr2, axis=2)
+    arr1 = diff_result["arr1"]
+    arr2 = diff_result["arr2"]
+
+    brightness = arr2.sum(axis=2, dtype=np.uint16) // 3
     dark_mask = mask & (brightness < 128)
     light_mask = mask & (brightness >= 128)
 
@@ -109,36 +304,79 @@ def generate_overlay(
     overlay_arr[dark_mask] = [255, 50, 50, 180]
     overlay_arr[light_mask] = [50, 50, 255, 140]
 
-    alpha_o = overlay_arr[:, :, 3:4].astype(np.float32) / 255.0
-    alpha_b = arr1[:, :, 3:4].astype(np.float32) / 255.0
+    # Fixed-point blend: (a*overlay + (255-a)*base + 127) // 255 stays in
+    # uint16 range (max 65152) and needs no clip.
+    alpha_o = overlay_arr[:, :, 3:4].astype(np.uint16)
+    result_arr = ((overlay_arr[:, :, :3] * alpha_o +
+                   arr1 * (255 - alpha_o) + 127) // 255).astype(np.uint8)
+
+    result_img = Image.fromarray(result_arr, "RGB")
+    result_img.save(output_path, "PNG", compress_level=1)
+
+    return {
+        "width": w,
+        "height": h,
+        "output_path": output_path,
+    }
 
-    out_alpha = alpha_o + alpha_b * (1 - alpha_o)
-    safe_alpha = np.where(out_alpha > 0, out_alpha, 1)
 
-    out_rgb = (overlay_arr[:, :, :3].astype(np.float32) * alpha_o +
-               arr1[:, :, :3].astype(np.float32) * alpha_b * (1 - alpha_o)) / safe_alpha
+def diff_and_overlay(
+    arr1: np.ndarray,
+    arr2: np.ndarray,
+    sensitivity: int,
+    output_path: str,
+) -> tuple:
+    arr1 = np.ascontiguousarray(arr1)
+    arr2 = np.ascontiguousarray(arr2)
+    h, w = arr1.shape[:2]
 
-    result_arr = np.zeros((h, w, 3), dtype=np.uint8)
-    result_arr[:, :, :3] = np.clip(out_rgb, 0, 255).astype(np.uint8)
+    mask = np.empty((h, w), dtype=np.bool_)
+    result_arr = np.empty((h, w, 3), dtype=np.uint8)
+    row_counts = np.empty(h, dtype=np.int64)
+    _diff_compose_kernel(arr1, arr2, sensitivity, mask, result_arr, row_counts)
+    changed_pixels = int(row_counts.sum())
 
-    result_img = Image.fromarray(result_arr, "RGB")
-    result_img.save(output_path, "PNG", optimize=True)
+    total_pixels = mask.size
+    change_pct = _change_pct(changed_pixels, total_pixels)
+    diff_result = {
+        "mask_packed": np.packbits(mask, axis=1),
+        "arr1": arr1,
+        "arr2": arr2,
+        "total_pixels": total_pixels,
+        "changed_pixels": changed_pixels,
+        "change_percentage": change_pct,
+    }
 
-    return {
+    Image.fromarray(result_arr, "RGB").save(output_path, "PNG", compress_level=1)
+    overlay_info = {
         "width": w,
         "height": h,
         "output_path": output_path,
     }
+    return diff_result, overlay_info
+
+
+def _binary_dilate(mask: np.ndarray, size: int = 7) -> np.ndarray:
+    # Separable square dilation: OR shifted rows, then shifted columns.
+    radius = size // 2
+    dilated = mask.copy()
+    for shift in range(1, radius + 1):
+        dilated[shift:, :] |= mask[:-shift, :]
+        dilated[:-shift, :] |= mask[shift:, :]
+    rows = dilated.copy()
+    for shift in range(1, radius + 1):
+        dilated[:, shift:] |= rows[:, :-shift]
+        dilated[:, :-shift] |= rows[:, shift:]
+    return dilated
 
 
 def generate_side_by_side(
-    img1: Image.Image,
-    img2: Image.Image,
+    arr1: np.ndarray,
+    arr2: np.ndarray,
     diff_result: dict,
     output_path: str,
 ) -> dict:
-    mask = diff_result["mask"]
-    h, w = mask.shape
+    h, w = diff_result["arr1"].shape[:2]
 
     gap = 20
     canvas_w = w * 2 + gap
@@ -148,77 +386,192 @@ def generate_side_by_side(
     draw.text((10, 10), "ORIGINAL (Doc A)", fill=(0, 0, 0))
     draw.text((w + gap + 10, 10), "REVISED (Doc B) - Changes Highlighted", fill=(0, 0, 0))
 
-    canvas.paste(img1, (0, 40))
+    canvas.paste(Image.fromarray(arr1), (0, 40))
 
-    arr2 = np.array(img2)
-    if np.any(mask):
-        region_mask_img = Image.fromarray((mask * 255).astype(np.uint8), "L")
-        dilated = region_mask_img.filter(ImageFilter.MaxFilter(7))
-        dilated_arr = np.array(dilated)
-        border_mask = (dilated_arr > 0) & ~mask
+    if diff_result["changed_pixels"] > 0:
+        mask = _unpack_mask(diff_result)
+        dilated = _binary_dilate(mask, 7)
+        border_mask = dilated & ~mask
 
-        highlight = np.zeros((h, w, 4), dtype=np.uint8)
-        highlight[border_mask] = [255, 0, 0, 100]
-
-        img2_rgba = img2.copy().convert("RGBA")
-        overlay_img = Image.fromarray(highlight, "RGBA")
-        img2_result = Image.alpha_composite(img2_rgba, overlay_img).convert("RGB")
+        # Paste a solid color through the mask: blends only the border
+        # pixels instead of alpha-compositing a full RGBA overlay.
+        border_alpha = Image.fromarray(border_mask.astype(np.uint8) * 100, "L")
+        img2_result = Image.fromarray(arr2)
+        img2_result.paste((255, 0, 0), mask=border_alpha)
     else:
-        img2_result = img2.copy().convert("RGB")
+        img2_result = Image.fromarray(arr2)
 
     canvas.paste(img2_result, (w + gap, 40))
 
-    canvas.save(output_path, "PNG", optimize=True)
+    canvas.save(output_path, "PNG", compress_level=1)
     return {"width": canvas_w, "height": h + 40, "output_path": output_path}
 
 
+def _parse_pages(spec: str, max_pages: int) -> list:
+    if spec == "all":
+        return list(range(max_pages))
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            pages.update(range(int(start), int(end) + 1))
+        else:
+            pages.add(int(part))
+    invalid = [p for p in pages if p < 0 or p >= max_pages]
+    if invalid:
+        raise ValueError(f"Pages {sorted(invalid)} out of range (documents have {max_pages} common pages)")
+    return sorted(pages)
+
+
+def _page_output_path(output_path: str, page_num: int) -> str:
+    return output_path.replace(".png", f"_p{page_num}.png")
+
+
+def _diff_page(file1: str, file2: str, page_num: int, dpi: int,
+               sensitivity: int, mode: str, output_path: str,
+               doc1=None, doc2=None, diff_dpi=None) -> dict:
+    _import_heavy()
+
+    # A lower diff DPI only applies when both inputs are PDFs (rasters
+    # cannot be re-rendered) and the ratio is integral so the mask
+    # upscales by pixel replication.
+    use_low_dpi = (diff_dpi is not None and diff_dpi < dpi and dpi % diff_dpi == 0
+                   and Path(file1).suffix.lower() == ".pdf"
+                   and Path(file2).suffix.lower() == ".pdf")
+
+    output_files = {}
+
+    if use_low_dpi:
+        arr1_lo = load_image(file1, page_num, diff_dpi, doc1)
+        arr2_lo = load_image(file2, page_num, diff_dpi, doc2)
+        arr1_lo, arr2_lo = normalize_sizes(arr1_lo, arr2_lo)
+        diff_result = compute_diff(arr1_lo, arr2_lo, sensitivity)
+        mask_lo = _unpack_mask(diff_result)
+
+        arr1 = load_image(file1, page_num, dpi, doc1)
+        arr2 = load_image(file2, page_num, dpi, doc2)
+        arr1, arr2 = normalize_sizes(arr1, arr2)
+        h, w = arr1.shape[:2]
+
+        factor = dpi // diff_dpi
+        mask_hi = mask_lo.repeat(factor, axis=0).repeat(factor, axis=1)
+        if mask_hi.shape != (h, w):
+            fitted = np.zeros((h, w), dtype=np.bool_)
+            crop_h = min(h, mask_hi.shape[0])
+            crop_w = min(w, mask_hi.shape[1])
+            fitted[:crop_h, :crop_w] = mask_hi[:crop_h, :crop_w]
+            mask_hi = fitted
+
+        diff_result["mask_packed"] = np.packbits(mask_hi, axis=1)
+        diff_result["arr1"] = np.ascontiguousarray(arr1)
+        diff_result["arr2"] = np.ascontiguousarray(arr2)
+
+        if mode in ("overlay", "both"):
+            output_files["overlay"] = generate_overlay(arr1, arr2, diff_result, output_path)
+    else:
+        arr1 = load_image(file1, page_num, dpi, doc1)
+        arr2 = load_image(file2, page_num, dpi, doc2)
+
+        arr1, arr2 = normalize_sizes(arr1, arr2)
+
+        if HAVE_NUMBA and mode in ("overlay", "both"):
+            diff_result, overlay_info = diff_and_overlay(arr1, arr2, sensitivity, output_path)
+            output_files["overlay"] = overlay_info
+        else:
+            diff_result = compute_diff(arr1, arr2, sensitivity)
+            if mode in ("overlay", "both"):
+                output_files["overlay"] = generate_overlay(arr1, arr2, diff_result, output_path)
+
+    if mode in ("side-by-side", "both"):
+        sbs_path = output_path.replace(".png", "_sbs.png")
+        output_files["side_by_side"] = generate_side_by_side(arr1, arr2, diff_result, sbs_path)
+
+    return {
+        "page": page_num,
+        "total_pixels": diff_result["total_pixels"],
+        "changed_pixels": diff_result["changed_pixels"],
+        "change_percentage": diff_result["change_percentage"],
+        "output_files": output_files,
+    }
+
+
 def main():
     parser = argparse.ArgumentParser(description="Visual document diff engine")
     parser.add_argument("file1", help="Path to first document (base/original)")
     parser.add_argument("file2", help="Path to second document (revised)")
     parser.add_argument("output", help="Output path for overlay image")
     parser.add_argument("--dpi", type=int, default=150, help="DPI for PDF rendering")
+    parser.add_argument("--diff-dpi", type=int, default=None,
+                        help="Optional lower DPI for the diff pass on PDF inputs; must divide --dpi. "
+                             "Stats are measured at this resolution and the mask is upscaled for rendering")
     parser.add_argument("--sensitivity", type=int, default=30, help="Pixel diff threshold (0-255)")
     parser.add_argument("--page", type=int, default=0, help="Page number to compare (0-indexed)")
+    parser.add_argument("--pages", default=None,
+                        help="Pages to compare concurrently, e.g. '0-3', '0,2,5' or 'all' (overrides --page)")
     parser.add_argument("--mode", choices=["overlay", "side-by-side", "both"], default="overlay",
                         help="Comparison mode")
     args = parser.parse_args()
 
     try:
-        pages1 = get_page_count(args.file1)
-        pages2 = get_page_count(args.file2)
-
-        img1 = load_image(args.file1, args.page, args.dpi)
-        img2 = load_image(args.file2, args.page, args.dpi)
-
-        img1, img2 = normalize_sizes(img1, img2)
-
-        diff_result = compute_diff(img1, img2, args.sensitivity)
-
-        output_files = {}
-
-        if args.mode in ("overlay", "both"):
-            overlay_path = args.output
-            overlay_info = generate_overlay(img1, img2, diff_result, overlay_path)
-            output_files["overlay"] = overlay_info
-
-        if args.mode in ("side-by-side", "both"):
-            sbs_path = args.output.replace(".png", "_sbs.png")
-            sbs_info = generate_side_by_side(img1, img2, diff_result, sbs_path)
-            output_files["side_by_side"] = sbs_info
-
-        result = {
-            "success": True,
-            "pages_doc1": pages1,
-            "pages_doc2": pages2,
-            "compared_page": args.page,
-            "total_pixels": diff_result["total_pixels"],
-            "changed_pixels": diff_result["changed_pixels"],
-            "change_percentage": diff_result["change_percentage"],
-            "sensitivity": args.sensitivity,
-            "dpi": args.dpi,
-            "output_files": output_files,
-        }
+        _import_heavy()
+
+        doc1, pages1 = _open_document(args.file1)
+        doc2, pages2 = _open_document(args.file2)
+
+        if args.pages is not None:
+            page_list = _parse_pages(args.pages, min(pages1, pages2))
+            max_workers = min(len(page_list), os.cpu_count() or 1)
+            # Spawned (not forked) workers: the parent has already
+            # initialized numba's parallel threading layer, and forking
+            # after that deadlocks interpreter shutdown under tbb/omp.
+            # Workers rebuild their state via _import_heavy().
+            mp_context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=mp_context) as pool:
+                futures = [
+                    pool.submit(_diff_page, args.file1, args.file2, page_num,
+                                args.dpi, args.sensitivity, args.mode,
+                                _page_output_path(args.output, page_num),
+                                diff_dpi=args.diff_dpi)
+                    for page_num in page_list
+                ]
+                page_results = [f.result() for f in futures]
+
+            total_pixels = sum(p["total_pixels"] for p in page_results)
+            changed_pixels = sum(p["changed_pixels"] for p in page_results)
+            result = {
+                "success": True,
+                "pages_doc1": pages1,
+                "pages_doc2": pages2,
+                "compared_pages": page_list,
+                "total_pixels": total_pixels,
+                "changed_pixels": changed_pixels,
+                "change_percentage": _change_pct(changed_pixels, total_pixels),
+                "sensitivity": args.sensitivity,
+                "dpi": args.dpi,
+                "pages": page_results,
+            }
+        else:
+            page_result = _diff_page(args.file1, args.file2, args.page,
+                                     args.dpi, args.sensitivity, args.mode,
+                                     args.output, doc1, doc2, args.diff_dpi)
+            result = {
+                "success": True,
+                "pages_doc1": pages1,
+                "pages_doc2": pages2,
+                "compared_page": args.page,
+                "total_pixels": page_result["total_pixels"],
+                "changed_pixels": page_result["changed_pixels"],
+                "change_percentage": page_result["change_percentage"],
+                "sensitivity": args.sensitivity,
+                "dpi": args.dpi,
+                "output_files": page_result["output_files"],
+            }
+
+        for doc in (doc1, doc2):
+            if doc is not None:
+                doc.close()
 
         print(json.dumps(result))
         sys.exit(0)